@@ -1,8 +1,24 @@
+import functools
+import gc
+import os
+
+# BLAS thread pools are fixed at import time, so configure them before
+# numpy loads; setdefault keeps any deployment-level override (e.g. capping
+# to 1 thread, which wins for small catalogs) in effect
+os.environ.setdefault('MKL_NUM_THREADS', str(os.cpu_count()))
+os.environ.setdefault('OPENBLAS_NUM_THREADS', str(os.cpu_count()))
+# MKL picks a slow non-SIMD code path on AMD CPUs unless told otherwise
+os.environ.setdefault('MKL_DEBUG_CPU_TYPE', '5')
+
 import streamlit as st
 import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
+from numba import njit, prange
+
+if os.environ.get('BAND_APP_DEBUG_BLAS'):
+    np.show_config()
 
 # --------- Page Configuration --------- #
 st.set_page_config(
@@ -13,7 +29,7 @@ st.set_page_config(
 )
 
 # --------- Custom CSS for Modern Styling --------- #
-st.markdown("""
+_CSS = """
 <style>
     .main-header {
         background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
@@ -98,7 +114,7 @@ st.markdown("""
         margin: 1rem 0;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
 
 # --------- Load datasets --------- #
 @st.cache_data
@@ -106,38 +122,160 @@ def load_data():
     try:
         # Load preprocessed dataset (with encoded features + Band column)
         pre_df = pd.read_csv('preprocessed_band_dataset.csv')
-        
+
         # Load original dataset with Band details
         orig_df = pd.read_csv('alternative_metal_bands.csv')
-        
-        # Merge to keep all details along with encoded features
-        df = pd.merge(orig_df, pre_df, on='Band')
-        
-        return df, orig_df
+
+        return pre_df, orig_df
     except FileNotFoundError as e:
         st.error(f"Dataset not found: {e}")
         return None, None
 
+# --------- Similarity kernel --------- #
+# For a catalog of a few thousand rows the sklearn/BLAS call overhead
+# dominates the actual FLOPs; a jitted dot over the pre-normalized matrix
+# avoids it. The factory bakes the feature count in as a compile-time
+# constant so the inner loop has a fixed trip count LLVM can unroll and
+# vectorize; one kernel is kept per shape
+@functools.lru_cache(maxsize=None)
+def make_cosine_kernel(n_features):
+    @njit(parallel=True, fastmath=True)
+    def cosine_vec(X, u, out):
+        for i in prange(X.shape[0]):
+            s = 0.0
+            for j in range(n_features):
+                s += X[i, j] * u[j]
+            out[i] = s
+    return cosine_vec
+
+# --------- Extract feature matrix once (outside the click handler) --------- #
+# cache_resource keeps one shared in-process reference; cache_data would
+# pickle the ndarray and hand every session its own copy
+@st.cache_resource
+def load_features(pre_df, orig_df):
+    # Merge to keep all details along with encoded features
+    df = pd.merge(orig_df, pre_df, on='Band')
+
+    # Dictionary-encode the repeated strings the merge materialized
+    # per row; each distinct value is stored once
+    for col in ('Origin', 'Active_x', 'Genres'):
+        df[col] = df[col].astype('category')
+
+    # Identify feature columns and split them into origin/genre groups
+    feat_cols = [col for col in df.columns if col not in ('Band', 'Active_x', 'Origin', 'Genres')]
+    origin_cols = tuple(col for col in feat_cols if col.startswith('Origin_'))
+    origin_set = frozenset(origin_cols)
+    genre_cols = tuple(col for col in feat_cols if col != 'Active_y' and col not in origin_set)
+
+    # Materialize a C-contiguous float32 matrix so BLAS sees a clean buffer;
+    # the one-hot features don't need float64 precision and float32 halves
+    # the bytes moved per query
+    # (the merged frame's block layout is whatever pd.merge produced, so
+    # force row-major order here rather than paying a hidden copy per query)
+    X_norm = np.ascontiguousarray(df[feat_cols].to_numpy(dtype=np.float32, copy=True))
+    assert X_norm.flags['C_CONTIGUOUS']
+
+    # Normalize rows in place so similarity is a single dot product per query
+    norms = np.linalg.norm(X_norm, axis=1)
+    norms[norms == 0] = 1
+    X_norm /= norms[:, None]
+
+    # Column-name -> position lookups for O(1) user-vector writes
+    origin_idx = {name: i for i, name in enumerate(origin_cols)}
+    genre_idx = {name: i for i, name in enumerate(genre_cols)}
+
+    # Band name -> row position, for O(1) exclusion of the input band
+    band_to_idx = {band: i for i, band in enumerate(df['Band'])}
+
+    # Specialize the kernel for this feature count and warm it here so the
+    # first click doesn't pay compile time
+    cosine_vec = make_cosine_kernel(X_norm.shape[1])
+    dummy = np.zeros((2, X_norm.shape[1]), dtype=np.float32)
+    cosine_vec(dummy, dummy[0], np.empty(2, dtype=np.float32))
+
+    # Keep only the display columns; the encoded columns live on in X_norm,
+    # so drop the wide merged frame and give its memory back
+    df_display = df[['Band', 'Active_x', 'Origin', 'Genres']].reset_index(drop=True)
+    del df
+    gc.collect()
+
+    return df_display, X_norm, cosine_vec, feat_cols, origin_idx, genre_idx, band_to_idx
+
+# --------- Precomputed genre tokens per band --------- #
+# Tokenize the comma-separated Genres strings once at load time instead of
+# re-parsing them whenever genres need comparing at the token level
+@st.cache_resource
+def load_genre_sets(orig_df):
+    genre_sets = orig_df['Genres'].str.split(',').map(
+        lambda tokens: frozenset(t.strip() for t in tokens)
+    )
+    return dict(zip(orig_df['Band'], genre_sets))
+
 # --------- Function to build user input vector --------- #
-def build_user_vector(user_active, user_origin, user_genres, origin_cols, genre_cols):
-    active_val = 1 if user_active == 'Yes' else 0
+# Returns a 1-D float32 ndarray laid out as [active, origins..., genres...],
+# fed straight to the similarity kernel with no DataFrame wrapper in between
+def build_user_vector(user_active, user_origin, user_genres, origin_idx, genre_idx):
+    n_origin = len(origin_idx)
+    vector = np.zeros(1 + n_origin + len(genre_idx), dtype=np.float32)
+    vector[0] = 1 if user_active == 'Yes' else 0
+
+    origin_pos = origin_idx.get('Origin_' + user_origin)
+    if origin_pos is not None:
+        vector[1 + origin_pos] = 1
 
-    origin_vector = [0] * len(origin_cols)
-    user_origin_col = 'Origin_' + user_origin
-    if user_origin_col in origin_cols:
-        idx = origin_cols.index(user_origin_col)
-        origin_vector[idx] = 1
+    genres_set = {g.strip() for g in user_genres.split(',')}
+    for genre in genres_set & genre_idx.keys():
+        vector[1 + n_origin + genre_idx[genre]] = 1
 
-    genres_list = [g.strip() for g in user_genres.split(',')]
-    genre_vector = [0] * len(genre_cols)
-    for i, g in enumerate(genre_cols):
-        if g in genres_list:
-            genre_vector[i] = 1
+    return vector
+
+# --------- Cached sidebar options --------- #
+@st.cache_data
+def load_origin_options(orig_df):
+    return tuple(sorted(orig_df['Origin'].unique()))
 
-    return [active_val] + origin_vector + genre_vector
+# --------- Cached chart builders --------- #
+# Keyed on the recommendation content, so repeat clicks that land on the
+# same top-K reuse the figure instead of rebuilding it
+@st.cache_data(show_spinner=False)
+def build_sim_bar(bands, sims):
+    fig = px.bar(
+        x=sims,
+        y=bands,
+        orientation='h',
+        title='Similarity Scores',
+        color=sims,
+        color_continuous_scale='Viridis',
+        labels={'x': 'Similarity', 'y': 'Band'}
+    )
+
+    fig.update_layout(
+        height=400,
+        showlegend=False,
+        yaxis={'categoryorder': 'total ascending'}
+    )
+
+    return fig
+
+@st.cache_data(show_spinner=False)
+def build_origin_pie(origins, counts):
+    fig = px.pie(
+        values=counts,
+        names=origins,
+        title='Recommended Bands by Origin'
+    )
+
+    fig.update_traces(textposition='inside', textinfo='percent+label')
+    fig.update_layout(height=400)
+
+    return fig
 
 # --------- Main Application --------- #
 def main():
+    # Styling (re-injected each rerun; Streamlit drops elements that are
+    # not re-rendered, so a once-per-session guard would lose the styles)
+    st.markdown(_CSS, unsafe_allow_html=True)
+
     # Header
     st.markdown("""
     <div class="main-header">
@@ -147,12 +285,18 @@ def main():
     """, unsafe_allow_html=True)
     
     # Load data
-    df, orig_df = load_data()
-    
-    if df is None or orig_df is None:
+    pre_df, orig_df = load_data()
+
+    if pre_df is None or orig_df is None:
         st.error("Unable to load datasets. Please check if the files exist.")
         return
-    
+
+    # Display frame, feature matrix, column groups and genre tokens
+    # (cached, computed once)
+    df, X_norm, cosine_vec, feat_cols, origin_idx, genre_idx, band_to_idx = load_features(pre_df, orig_df)
+    band_to_genres = load_genre_sets(orig_df)
+    origin_options = load_origin_options(orig_df)
+
     # Sidebar for user inputs
     with st.sidebar:
         st.markdown("### 🎵 Your Preferences")
@@ -172,7 +316,7 @@ def main():
         
         user_origin = st.selectbox(
             "Band origin",
-            sorted(orig_df['Origin'].unique()),
+            origin_options,
             help="Select the country/region of origin"
         )
         
@@ -188,7 +332,7 @@ def main():
         with col1:
             st.metric("Total Bands", len(df))
         with col2:
-            st.metric("Countries", len(orig_df['Origin'].unique()))
+            st.metric("Countries", len(origin_options))
     
     # Main content area
     col1, col2 = st.columns([2, 1])
@@ -197,29 +341,26 @@ def main():
         if st.button("🔍 Find Recommendations", type="primary"):
             if user_band and user_genres:
                 with st.spinner("Analyzing musical preferences..."):
-                    # Prepare features dataframe for similarity
-                    features_df = df.drop(columns=['Band', 'Active_x', 'Origin', 'Genres'])
-                    
-                    # Identify origin and genre columns dynamically
-                    origin_cols = [col for col in features_df.columns if col.startswith('Origin_')]
-                    genre_cols = [col for col in features_df.columns if col not in ['Active_y'] + origin_cols]
-                    
                     # Build user vector
-                    user_vector = build_user_vector(user_active, user_origin, user_genres, origin_cols, genre_cols)
-                    user_df = pd.DataFrame([user_vector], columns=['Active_y'] + origin_cols + genre_cols)
-                    
-                    # Calculate similarity
-                    sim = cosine_similarity(user_df, features_df)[0]
-                    df['Similarity'] = sim
-                    
-                    # Sort by similarity
-                    results = df.sort_values(by='Similarity', ascending=False)
-                    
-                    # Exclude input band
-                    results = results[results['Band'] != user_band]
-                    
-                    # Get top recommendations
-                    top_recommendations = results.head(10)
+                    user_vec = build_user_vector(user_active, user_origin, user_genres, origin_idx, genre_idx)
+                    user_vec /= max(np.linalg.norm(user_vec), 1e-12)
+
+                    # Calculate similarity (rows of X_norm are unit length)
+                    sim = np.empty(X_norm.shape[0], dtype=np.float32)
+                    cosine_vec(X_norm, user_vec, sim)
+
+                    # Partial-select top K (one extra in case the input band ranks there)
+                    K = min(11, len(sim))
+                    top = np.argpartition(sim, -K)[-K:]
+                    top = top[np.argsort(-sim[top])]
+
+                    # Exclude input band by row index and get top recommendations
+                    excluded = band_to_idx.get(user_band)
+                    if excluded is not None:
+                        top = top[top != excluded]
+
+                    # (keep sim local; never write columns into the cached df)
+                    top_recommendations = df.iloc[top].assign(Similarity=sim[top]).head(10)
                     
                     # Display results
                     st.markdown("### 🎶 Top Recommendations")
@@ -231,9 +372,14 @@ def main():
                         # Display detailed recommendations
                         display_cols = ['Band', 'Active_x', 'Origin', 'Genres', 'Similarity']
                         recommendations_df = top_recommendations[display_cols].head(5).reset_index(drop=True)
-                        
-                        # Format similarity as percentage
-                        recommendations_df['Similarity'] = recommendations_df['Similarity'].apply(lambda x: f"{x:.1%}")
+
+                        # Decode categoricals to plain strings only at render time
+                        for col in ('Active_x', 'Origin', 'Genres'):
+                            recommendations_df[col] = recommendations_df[col].astype(str)
+
+                        # Format similarity as percentage in one assignment
+                        sims = recommendations_df['Similarity'].to_numpy()
+                        recommendations_df['Similarity'] = [f"{s:.1%}" for s in sims]
                         
                         # Rename columns for better display
                         recommendations_df.columns = ['Band', 'Status', 'Origin', 'Genres', 'Match %']
@@ -244,56 +390,48 @@ def main():
                             hide_index=True
                         )
                         
-                        # Show individual recommendation cards
+                        # Show individual recommendation cards in one markdown call
                         st.markdown("### 🎯 Recommendation Details")
-                        for idx, row in recommendations_df.head(3).iterrows():
-                            st.markdown(f"""
+                        cards = ''.join(f"""
                             <div class="recommendation-card">
                                 <h4>🎸 {row['Band']}</h4>
                                 <p><strong>Origin:</strong> {row['Origin']} | <strong>Status:</strong> {row['Status']} | <strong>Match:</strong> {row['Match %']}</p>
                                 <p><strong>Genres:</strong> {row['Genres']}</p>
                             </div>
-                            """, unsafe_allow_html=True)
+                            """ for row in recommendations_df.head(3).to_dict('records'))
+                        st.markdown(cards, unsafe_allow_html=True)
                     
                     with tab2:
                         # Similarity chart
                         chart_data = top_recommendations[['Band', 'Similarity']].head(8)
-                        
-                        fig = px.bar(
-                            chart_data,
-                            x='Similarity',
-                            y='Band',
-                            orientation='h',
-                            title='Similarity Scores',
-                            color='Similarity',
-                            color_continuous_scale='Viridis'
-                        )
-                        
-                        fig.update_layout(
-                            height=400,
-                            showlegend=False,
-                            yaxis={'categoryorder': 'total ascending'}
+
+                        fig = build_sim_bar(
+                            tuple(chart_data['Band']),
+                            tuple(float(s) for s in chart_data['Similarity'])
                         )
-                        
+
                         st.plotly_chart(fig, use_container_width=True)
                     
                     with tab3:
-                        # Origin distribution
-                        origin_counts = top_recommendations['Origin'].value_counts().head(10)
-                        
-                        fig = px.pie(
-                            values=origin_counts.values,
-                            names=origin_counts.index,
-                            title='Recommended Bands by Origin'
+                        # Origin distribution: with Origin categorical this is
+                        # an integer bincount over the dictionary codes
+                        categories = top_recommendations['Origin'].cat.categories
+                        counts = np.bincount(
+                            top_recommendations['Origin'].cat.codes,
+                            minlength=len(categories)
                         )
-                        
-                        fig.update_traces(textposition='inside', textinfo='percent+label')
-                        fig.update_layout(height=400)
-                        
+                        order = np.argsort(-counts)[:10]
+                        order = order[counts[order] > 0]
+
+                        fig = build_origin_pie(
+                            tuple(str(categories[i]) for i in order),
+                            tuple(int(counts[i]) for i in order)
+                        )
+
                         st.plotly_chart(fig, use_container_width=True)
                     
                     # Success message
-                    st.success(f"✅ Found {len(results)} similar bands based on your preferences!")
+                    st.success(f"✅ Found {len(top_recommendations)} similar bands based on your preferences!")
                     
             else:
                 st.warning("⚠️ Please enter both band name and genres to get recommendations.")